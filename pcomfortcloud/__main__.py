@@ -1,27 +1,32 @@
 import argparse
+import functools
 import json
 import logging
+import sys
 
 from enum import Enum
 
 import pcomfortcloud
 
 def print_result(obj, indent = 0):
+    pad = " "*indent
+    width = 25-indent
+
     for key in obj:
         value = obj[key]
 
         if isinstance(value, dict):
-            print(" "*indent + key)
+            print(pad + key)
             print_result(value, indent + 4)
         elif isinstance(value, Enum):
-            print(" "*indent + "{0: <{width}}: {1}".format(key, value.name, width=25-indent))
+            print(pad + key.ljust(width) + ": " + value.name)
         elif isinstance(value, list):
-            print(" "*indent + "{0: <{width}}:".format(key, width=25-indent))
+            print(pad + key.ljust(width) + ":")
             for elt in value:
                 print_result(elt, indent + 4)
                 print("")
         else:
-            print(" "*indent + "{0: <{width}}: {1}".format(key, value, width=25-indent))
+            print(pad + key.ljust(width) + ": " + str(value))
 
 def str2bool(v):
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
@@ -31,63 +36,16 @@ def str2bool(v):
     else:
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
+@functools.lru_cache(maxsize=None)
 def namesFromEnum(enumCls):
-	return list(map(lambda i: i.name, enumCls))
-
-def main():
-    """ Start pcomfortcloud Comfort Cloud command line """
-
-    parser = argparse.ArgumentParser(
-        description='Read or change status of pcomfortcloud Climate devices')
-
-    parser.add_argument(
-        'username',
-        help='Username for pcomfortcloud Comfort Cloud')
-
-    parser.add_argument(
-        'password',
-        help='Password for pcomfortcloud Comfort Cloud')
-
-    parser.add_argument(
-        '-t', '--token',
-        metavar='FILE',
-        help='File to store session cache in (default: %(default)s)',
-        default='~/.pcomfortcloud-token.js')
-
-    parser.add_argument(
-        '-s', '--skipVerify',
-        help='Skip Ssl verification if set as True',
-        type=str2bool, nargs='?', const=True,
-        default=False)
-
-    parser.add_argument(
-        '-r', '--raw',
-        help='Raw dump of response',
-        action='store_true',
-        default=False)
-
-    parser.add_argument(
-        '-v', '--verbose', dest='verbosity',
-        help='Increase verbosity of debug output',
-        action='count',
-        default=0)
-
-    parser.add_argument(
-        '-c', '--cache',
-        help="Cached information is retrieved from the token file to speed up operation, (default: %(default)s)",
-        type=pcomfortcloud.constants.Cache,
-        choices=list(pcomfortcloud.constants.Cache),
-        default=pcomfortcloud.constants.Cache.Token
-    )
-
-    commandparser = parser.add_subparsers(
-        help='commands',
-        dest='command')
+    return [member.name for member in enumCls]
 
+def _build_list_parser(commandparser):
     commandparser.add_parser(
         'list',
         help="Get a list of all devices")
 
+def _build_get_parser(commandparser):
     get_parser = commandparser.add_parser(
         'get',
         help="Get status of a device")
@@ -97,6 +55,7 @@ def main():
         type=int,
         help='Device number #')
 
+def _build_set_parser(commandparser):
     set_parser = commandparser.add_parser(
         'set',
         help="Set status of a device")
@@ -156,6 +115,7 @@ def main():
         choices=namesFromEnum(pcomfortcloud.constants.AirSwingLR),
         help='Horizontal position of the air swing')
 
+def _build_dump_parser(commandparser):
     dump_parser = commandparser.add_parser(
         'dump',
         help="Dump data of a device")
@@ -165,6 +125,7 @@ def main():
         type=int,
         help='Device number 1-x')
 
+def _build_history_parser(commandparser):
     history_parser = commandparser.add_parser(
         'history',
         help="Dump history of a device")
@@ -184,6 +145,117 @@ def main():
         type=str,
         help='date of day like 20190807')
 
+# subparsers are built on demand, only the one for the requested command is needed
+_COMMAND_BUILDERS = {
+    'list': _build_list_parser,
+    'get': _build_get_parser,
+    'set': _build_set_parser,
+    'dump': _build_dump_parser,
+    'history': _build_history_parser,
+}
+
+# global options which consume the following argument as their value
+_OPTIONS_WITH_VALUE = ('-t', '--token', '-c', '--cache')
+
+# global options with an optional boolean value
+_OPTIONS_WITH_BOOL = ('-s', '--skipVerify')
+
+# global options without a value
+_OPTIONS_WITHOUT_VALUE = ('-r', '--raw', '--verbose')
+
+def _is_bool(arg):
+    try:
+        str2bool(arg)
+    except argparse.ArgumentTypeError:
+        return False
+    return True
+
+def _detect_command(argv):
+    """ Find the subcommand in the command line without parsing it.
+
+    Returns None if no command could be found, help was requested before it or
+    an option is not known exactly (abbreviated, combined, '--opt=value', ...),
+    in which case all subparsers have to be built.
+    """
+    positionals = 0
+    idx = 0
+    while idx < len(argv):
+        arg = argv[idx]
+        idx += 1
+
+        if arg in _OPTIONS_WITH_VALUE:
+            idx += 1
+        elif arg in _OPTIONS_WITH_BOOL:
+            if idx < len(argv) and _is_bool(argv[idx]):
+                idx += 1
+        elif arg in _OPTIONS_WITHOUT_VALUE or (arg.startswith('-v') and arg.strip('v') == '-'):
+            continue
+        elif arg.startswith('-') and arg != '-':
+            # help, '--' or anything argparse has to interpret itself
+            return None
+        else:
+            positionals += 1
+            if positionals == 3:
+                return arg if arg in _COMMAND_BUILDERS else None
+    return None
+
+def main():
+    """ Start pcomfortcloud Comfort Cloud command line """
+
+    parser = argparse.ArgumentParser(
+        description='Read or change status of pcomfortcloud Climate devices')
+
+    parser.add_argument(
+        'username',
+        help='Username for pcomfortcloud Comfort Cloud')
+
+    parser.add_argument(
+        'password',
+        help='Password for pcomfortcloud Comfort Cloud')
+
+    parser.add_argument(
+        '-t', '--token',
+        metavar='FILE',
+        help='File to store session cache in (default: %(default)s)',
+        default='~/.pcomfortcloud-token.js')
+
+    parser.add_argument(
+        '-s', '--skipVerify',
+        help='Skip Ssl verification if set as True',
+        type=str2bool, nargs='?', const=True,
+        default=False)
+
+    parser.add_argument(
+        '-r', '--raw',
+        help='Raw dump of response',
+        action='store_true',
+        default=False)
+
+    parser.add_argument(
+        '-v', '--verbose', dest='verbosity',
+        help='Increase verbosity of debug output',
+        action='count',
+        default=0)
+
+    parser.add_argument(
+        '-c', '--cache',
+        help="Cached information is retrieved from the token file to speed up operation, (default: %(default)s)",
+        type=pcomfortcloud.constants.Cache,
+        choices=list(pcomfortcloud.constants.Cache),
+        default=pcomfortcloud.constants.Cache.Token
+    )
+
+    commandparser = parser.add_subparsers(
+        help='commands',
+        dest='command')
+
+    command = _detect_command(sys.argv[1:])
+    if command is not None:
+        _COMMAND_BUILDERS[command](commandparser)
+    else:
+        for build in _COMMAND_BUILDERS.values():
+            build(commandparser)
+
     args = parser.parse_args()
 
     if args.verbosity > 1:
@@ -197,30 +269,33 @@ def main():
     session = pcomfortcloud.Session(args.username, args.password, args.token, args.raw, not args.skipVerify,
                                     caching=args.cache)
     session.login()
+    devices = session.get_devices()
     try:
         if args.command == 'list':
             print("list of devices and its device id (1-x)")
-            for idx, device in enumerate(session.get_devices()):
+            for idx, device in enumerate(devices):
                 if idx > 0:
                     print('')
 
                 print("device #{}".format(idx + 1))
                 print_result(device, 4)
 
-        if args.command == 'get':
-            if int(args.device) <= 0 or int(args.device) > len(session.get_devices()):
-                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(session.get_devices())))
+        elif args.command == 'get':
+            deviceIdx = int(args.device)
+            if not 1 <= deviceIdx <= len(devices):
+                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(devices)))
 
-            device = session.get_devices()[int(args.device) - 1]
+            device = devices[deviceIdx - 1]
             print("reading from device '{}' ({})".format(device['name'], device['id']))
 
             print_result(session.get_device(device['id']))
 
-        if args.command == 'set':
-            if int(args.device) <= 0 or int(args.device) > len(session.get_devices()):
-                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(session.get_devices())))
+        elif args.command == 'set':
+            deviceIdx = int(args.device)
+            if not 1 <= deviceIdx <= len(devices):
+                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(devices)))
 
-            device = session.get_devices()[int(args.device) - 1]
+            device = devices[deviceIdx - 1]
             print("writing to device '{}' ({})".format(device['name'], device['id']))
 
             kwargs = {}
@@ -251,19 +326,21 @@ def main():
 
             session.set_device(device['id'], **kwargs)
 
-        if args.command == 'dump':
-            if int(args.device) <= 0 or int(args.device) > len(session.get_devices()):
-                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(session.get_devices())))
+        elif args.command == 'dump':
+            deviceIdx = int(args.device)
+            if not 1 <= deviceIdx <= len(devices):
+                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(devices)))
 
-            device = session.get_devices()[int(args.device) - 1]
+            device = devices[deviceIdx - 1]
 
             print_result(session.dump(device['id']))
 
-        if args.command == 'history':
-            if int(args.device) <= 0 or int(args.device) > len(session.get_devices()):
-                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(session.get_devices())))
+        elif args.command == 'history':
+            deviceIdx = int(args.device)
+            if not 1 <= deviceIdx <= len(devices):
+                raise Exception("device not found, acceptable device id is from {} to {}".format(1, len(devices)))
 
-            device = session.get_devices()[int(args.device) - 1]
+            device = devices[deviceIdx - 1]
 
             print_result(session.history(device['id'], args.mode, args.date))
 
@@ -2,17 +2,100 @@
 Panasonic session, using Panasonic Comfort Cloud app api
 '''
 
+import functools
 import hashlib
 import json
 import logging
 import os
+import re
+import sys
+import time
 
 import requests
 import urllib3
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from . import constants, urls
 
 
+if sys.version_info >= (3, 9):
+    # the hash only derives a device id, skip the FIPS security checks
+    _md5 = functools.partial(hashlib.md5, usedforsecurity=False)
+else:
+    _md5 = hashlib.md5
+
+_MISSING = object()
+
+# seconds the air swing auto state read by get_device() is reused by set_device()
+_DEVICE_STATE_MAX_AGE = 60
+
+_TOKEN_PATTERN = re.compile(r'"uToken"\s*:\s*"([^"\\]+)"')
+
+# (api parameter, result key) copied as is
+_PLAIN_PARAMETERS = (
+    ('insideTemperature', 'temperatureInside'),
+    ('outTemperature', 'temperatureOutside'),
+    ('temperatureSet', 'temperature'),
+    ('currencyUnit', 'currencyUnit'),
+    ('energyConsumption', 'energyConsumption'),
+    ('estimatedCost', 'estimatedCost'),
+    ('historyDataList', 'historyDataList'),
+)
+
+
+def _members_by_value(enumCls):
+    return {member.value: member for member in enumCls}
+
+
+_POWER_BY_VALUE = _members_by_value(constants.Power)
+_OPERATION_MODE_BY_VALUE = _members_by_value(constants.OperationMode)
+_FAN_SPEED_BY_VALUE = _members_by_value(constants.FanSpeed)
+_AIR_SWING_LR_BY_VALUE = _members_by_value(constants.AirSwingLR)
+_AIR_SWING_UD_BY_VALUE = _members_by_value(constants.AirSwingUD)
+_ECO_MODE_BY_VALUE = _members_by_value(constants.EcoMode)
+_NANOE_MODE_BY_VALUE = _members_by_value(constants.NanoeMode)
+
+# (api parameter, result key, enum, value -> enum member)
+_ENUM_PARAMETERS = (
+    ('operate', 'power', constants.Power, _POWER_BY_VALUE),
+    ('operationMode', 'mode', constants.OperationMode, _OPERATION_MODE_BY_VALUE),
+    ('fanSpeed', 'fanSpeed', constants.FanSpeed, _FAN_SPEED_BY_VALUE),
+    ('airSwingLR', 'airSwingHorizontal', constants.AirSwingLR, _AIR_SWING_LR_BY_VALUE),
+    ('airSwingUD', 'airSwingVertical', constants.AirSwingUD, _AIR_SWING_UD_BY_VALUE),
+    ('ecoMode', 'eco', constants.EcoMode, _ECO_MODE_BY_VALUE),
+    ('nanoe', 'nanoe', constants.NanoeMode, _NANOE_MODE_BY_VALUE),
+)
+
+# set_device() keyword -> (api parameter, accepted enum)
+_SET_PARAMETERS = {
+    'power': ('operate', constants.Power),
+    'mode': ('operationMode', constants.OperationMode),
+    'fanSpeed': ('fanSpeed', constants.FanSpeed),
+    'eco': ('ecoMode', constants.EcoMode),
+}
+
+
+def _fan_auto(parameters):
+    """ Air swing auto bits of parsed device parameters, 1: horizontal, 2: vertical """
+    fanAuto = 0
+    if parameters.get('airSwingHorizontal') == constants.AirSwingLR.Auto:
+        fanAuto = fanAuto | 1
+    if parameters.get('airSwingVertical') == constants.AirSwingUD.Auto:
+        fanAuto = fanAuto | 2
+    return fanAuto
+
+
+def _decode(response):
+    """ Parse a json response body, using orjson if it is installed """
+    if orjson is None:
+        return response.json()
+    return orjson.loads(response.content)
+
+
 class Error(Exception):
     ''' Panasonic session error '''
 
@@ -75,6 +158,10 @@ class Cache():
             self._vid = value
             self._dirty = True
 
+    def invalidate_token(self):
+        """ Drop the token but keep the remaining cached values """
+        self._vid = None
+
     @property
     def is_dirty(self):
         return self._dirty
@@ -94,7 +181,7 @@ class Cache():
 
         if len(dct) > 0:
             with open(fileName, 'w') as f:
-                json.dump(dct, f, indent=2, sort_keys=True)
+                f.write(json.dumps(dct, indent=2, sort_keys=True))
 
             self._logger.info("%s written to cache '%s'", dct.keys(), fileName)
 
@@ -113,16 +200,24 @@ class Cache():
 
         self.clear()
 
-        if os.path.exists(fileName):
-            self._logger.debug("attempting to read cache from '%s'", fileName)
-            try:
-                with open(fileName, 'r') as cookieFile:
-                    dct = json.load(cookieFile)
-                    self._logger.info("%s read from cache '%s'", dct.keys(), fileName)
-                    self.from_dict(dct)
+        try:
+            size = os.path.getsize(fileName)
+        except OSError:
+            return
 
-            except json.decoder.JSONDecodeError as ex:
-                self._logger.debug("invalid JSON in cache file: %s", ex.msg)
+        if size == 0:
+            self._logger.debug("cache file '%s' is empty", fileName)
+            return
+
+        self._logger.debug("attempting to read cache from '%s'", fileName)
+        try:
+            with open(fileName, 'r') as cookieFile:
+                dct = json.loads(cookieFile.read())
+                self._logger.info("%s read from cache '%s'", dct.keys(), fileName)
+                self.from_dict(dct)
+
+        except ValueError as ex:
+            self._logger.debug("invalid JSON in cache file: %s", ex)
 
 
 class Session(object):
@@ -142,6 +237,8 @@ class Session(object):
         self._cache = Cache(caching)
         self._devices = None
         self._deviceIndexer = {}
+        self._guidHashes = {}
+        self._fanAutoStates = {}
         self._raw = raw
 
         if verifySsl is False:
@@ -151,6 +248,16 @@ class Session(object):
             self._verifySsl = os.path.join(os.path.dirname(__file__),
                                            "certificatechain.pem")
 
+        # keep connections alive across api calls
+        self._http = requests.Session()
+        self._http.headers.update({
+            "X-APP-TYPE": "1",
+            "X-APP-VERSION": "1.10.0",
+            "User-Agent": "G-RAC",
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        })
+
     def __enter__(self):
         self.login()
         return self
@@ -175,18 +282,24 @@ class Session(object):
         if self._cache.is_dirty:
             self._cache.to_file(self._tokenFileName)
 
+        self._build_device_index()
+
+    def invalidate_token(self):
+        """ Forget the current token, cached groups are kept """
+
+        self._cache.invalidate_token()
+
     def logout(self):
         """ Logout """
 
-    def _headers(self):
-        return {
-            "X-APP-TYPE": "1",
-            "X-APP-VERSION": "1.10.0",
-            "X-User-Authorization": self._cache.vid,
-            "User-Agent": "G-RAC",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
+        self._http.close()
+
+    def _update_headers(self):
+        """ Refresh the token sent along with every request """
+        if self._cache.vid is None:
+            self._http.headers.pop("X-User-Authorization", None)
+        else:
+            self._http.headers["X-User-Authorization"] = self._cache.vid
 
     def _request(self, url, method='get', payload=None, allowReauth=True, requestErrorClass=RequestError):
         """ Send any REST request to the cloud api and return it's response.
@@ -203,15 +316,20 @@ class Session(object):
         Return: response
         """
         try:
-            response = requests.request(method=method, url=url,
-                                        json=payload, headers=self._headers(),
-                                        verify=self._verifySsl)
+            self._update_headers()
+            response = self._http.request(method=method, url=url, json=payload, verify=self._verifySsl)
             if response.status_code == requests.codes.unauthorized and allowReauth:
                 # expired token response contains the following message: {'message': 'Token expires', 'code': 4100}
-                self.login(useCache=False)
-                response = requests.request(method=method, url=url,
-                                            json=payload, headers=self._headers(),
-                                            verify=self._verifySsl)
+                # only the token is replaced, the cached groups are still valid
+                groups = self._cache.groups
+                self.invalidate_token()
+                self._create_token()
+                self._cache.groups = groups
+                if self._cache.is_dirty:
+                    self._cache.to_file(self._tokenFileName)
+
+                self._update_headers()
+                response = self._http.request(method=method, url=url, json=payload, verify=self._verifySsl)
 
         except requests.exceptions.RequestException as ex:
             raise requestErrorClass(ex)
@@ -241,7 +359,13 @@ class Session(object):
             print(response.text)
             print("--- raw ending    ---\n")
 
-        self._cache.vid = json.loads(response.text)['uToken']
+        # the token is opaque and never contains escapes, so it can be picked from the
+        # small login response directly; anything unexpected goes through the json parser
+        match = _TOKEN_PATTERN.search(response.text)
+        if match:
+            self._cache.vid = match.group(1)
+        else:
+            self._cache.vid = _decode(response)['uToken']
 
     def _read_token(self):
         self._cache.from_file(self._tokenFileName)
@@ -257,38 +381,49 @@ class Session(object):
             print(response.text)
             print("--- raw ending    ---\n")
 
-        self._cache.groups = json.loads(response.text)
-        self._devices = None
+        self._cache.groups = _decode(response)
+
+    def _build_device_index(self):
+        """ Collect the devices of all groups and index them by their id """
+
+        self._devices = []
+        self._deviceIndexer = {}
+
+        for group in self._cache.groups['groupList']:
+            if 'deviceList' in group:
+                deviceList = group.get('deviceList', [])
+            else:
+                deviceList = group.get('deviceIdList', [])
+
+            for device in deviceList:
+                if device:
+                    deviceId = None
+                    if 'deviceHashGuid' in device:
+                        deviceId = device['deviceHashGuid']
+                    else:
+                        deviceId = self._hash_guid(device['deviceGuid'])
+
+                    self._deviceIndexer[deviceId] = device['deviceGuid']
+                    self._devices.append({
+                        'id': deviceId,
+                        'name': device['deviceName'],
+                        'group': group['groupName'],
+                        'model': device['deviceModuleNumber'] if 'deviceModuleNumber' in device else ''
+                    })
+
+    def _hash_guid(self, deviceGuid):
+        """ md5 of the device guid, computed once per guid """
+
+        deviceId = self._guidHashes.get(deviceGuid)
+        if deviceId is None:
+            deviceId = _md5(deviceGuid.encode('utf-8')).hexdigest()
+            self._guidHashes[deviceGuid] = deviceId
+        return deviceId
 
     def get_devices(self, group=None):
         if not self._cache.is_valid:
             self.login()
 
-        if self._devices is None:
-            self._devices = []
-
-            for group in self._cache.groups['groupList']:
-                if 'deviceList' in group:
-                    deviceList = group.get('deviceList', [])
-                else:
-                    deviceList = group.get('deviceIdList', [])
-
-                for device in deviceList:
-                    if device:
-                        deviceId = None
-                        if 'deviceHashGuid' in device:
-                            deviceId = device['deviceHashGuid']
-                        else:
-                            deviceId = hashlib.md5(device['deviceGuid'].encode('utf-8')).hexdigest()
-
-                        self._deviceIndexer[deviceId] = device['deviceGuid']
-                        self._devices.append({
-                            'id': deviceId,
-                            'name': device['deviceName'],
-                            'group': group['groupName'],
-                            'model': device['deviceModuleNumber'] if 'deviceModuleNumber' in device else ''
-                        })
-
         return self._devices
 
     def dump(self, deviceId):
@@ -296,7 +431,7 @@ class Session(object):
 
         if(deviceGuid):
             response = self._request(urls.status(deviceGuid))
-            return json.loads(response.text)
+            return _decode(response)
 
         return None
 
@@ -324,7 +459,7 @@ class Session(object):
                 print(response.text)
                 print("--- raw ending    ---")
 
-            _json = json.loads(response.text)
+            _json = _decode(response)
             return {
                 'id': id,
                 'parameters': self._read_parameters(_json)
@@ -344,20 +479,36 @@ class Session(object):
                 print(response.text)
                 print("--- raw ending    ---")
 
-            _json = json.loads(response.text)
+            _json = _decode(response)
+            parameters = self._read_parameters(_json['parameters'])
+            self._fanAutoStates[id] = (time.monotonic(), _fan_auto(parameters))
             return {
                 'id': id,
-                'parameters': self._read_parameters(_json['parameters'])
+                'parameters': parameters
             }
 
         return None
 
+    def _current_fan_auto(self, id):
+        """ Last known air swing auto bits of a device, read again when missing or outdated """
+
+        state = self._fanAutoStates.get(id)
+        if state is not None and time.monotonic() - state[0] <= _DEVICE_STATE_MAX_AGE:
+            return state[1]
+
+        device = self.get_device(id)
+        return _fan_auto(device['parameters']) if device else 0
+
     def set_device(self, id, **kwargs):
         """ Set parameters of device
 
         Args:
             id  (str): Id of the device
             kwargs   : {temperature=float}, {mode=OperationMode}, {fanSpeed=FanSpeed}, {power=Power}, {airSwingHorizontal=}, {airSwingVertical=}, {eco=EcoMode}
+
+        When only one air swing axis is given, the auto state of the other one may come from a get_device()
+        call up to _DEVICE_STATE_MAX_AGE seconds old; a change of that axis made elsewhere in the meantime
+        is overwritten.
         """
 
         parameters = {}
@@ -366,40 +517,30 @@ class Session(object):
 
         if kwargs is not None:
             for key, value in kwargs.items():
-                if key == 'power' and isinstance(value, constants.Power):
-                    parameters['operate'] = value.value
+                entry = _SET_PARAMETERS.get(key)
+                if entry is not None:
+                    if isinstance(value, entry[1]):
+                        parameters[entry[0]] = value.value
 
-                if key == 'temperature':
+                elif key == 'temperature':
                     parameters['temperatureSet'] = value
 
-                if key == 'mode' and isinstance(value, constants.OperationMode):
-                    parameters['operationMode'] = value.value
-
-                if key == 'fanSpeed' and isinstance(value, constants.FanSpeed):
-                    parameters['fanSpeed'] = value.value
-
-                if key == 'airSwingHorizontal' and isinstance(value, constants.AirSwingLR):
+                elif key == 'airSwingHorizontal' and isinstance(value, constants.AirSwingLR):
                     airX = value
 
-                if key == 'airSwingVertical' and isinstance(value, constants.AirSwingUD):
+                elif key == 'airSwingVertical' and isinstance(value, constants.AirSwingUD):
                     airY = value
 
-                if key == 'eco' and isinstance(value, constants.EcoMode):
-                    parameters['ecoMode'] = value.value
-
-                if key == 'nanoe' and isinstance(value, constants.NanoeMode) and value != constants.NanoeMode.Unavailable:
+                elif key == 'nanoe' and isinstance(value, constants.NanoeMode) and value != constants.NanoeMode.Unavailable:
                     parameters['nanoe'] = value.value
 
         # routine to set the auto mode of fan (either horizontal, vertical, both or disabled)
         if airX is not None or airY is not None:
             fanAuto = 0
-            device = self.get_device(id)
-
-            if device and device['parameters']['airSwingHorizontal'].value == -1:
-                fanAuto = fanAuto | 1
 
-            if device and device['parameters']['airSwingVertical'].value == -1:
-                fanAuto = fanAuto | 2
+            # the current state only matters for the axis not given
+            if airX is None or airY is None:
+                fanAuto = self._current_fan_auto(id)
 
             if airX is not None:
                 if airX.value == -1:
@@ -413,7 +554,6 @@ class Session(object):
                     fanAuto = fanAuto | 2
                 else:
                     fanAuto = fanAuto & ~2
-                    print(airY.name)
                     parameters['airSwingUD'] = airY.value
 
             if fanAuto == 3:
@@ -439,13 +579,14 @@ class Session(object):
                 print("--- raw out ending    ---")
 
             response = self._request(urls.control(), method='post', payload=payload)
+            self._fanAutoStates.pop(id, None)
 
             if(self._raw is True):
                 print("--- raw in beginning ---")
                 print(response.text)
                 print("--- raw in ending    ---\n")
 
-            json.loads(response.text)
+            _decode(response)
 
             return True
 
@@ -454,47 +595,27 @@ class Session(object):
     def _read_parameters(self, parameters):
         value = {}
 
-        _convert = {
-            'insideTemperature': 'temperatureInside',
-            'outTemperature': 'temperatureOutside',
-            'temperatureSet': 'temperature',
-            'currencyUnit': 'currencyUnit',
-            'energyConsumption': 'energyConsumption',
-            'estimatedCost': 'estimatedCost',
-            'historyDataList': 'historyDataList',
-        }
-        for key in _convert:
-            if key in parameters:
-                value[_convert[key]] = parameters[key]
-
-        if 'operate' in parameters:
-            value['power'] = constants.Power(parameters['operate'])
-
-        if 'operationMode' in parameters:
-            value['mode'] = constants.OperationMode(parameters['operationMode'])
-
-        if 'fanSpeed' in parameters:
-            value['fanSpeed'] = constants.FanSpeed(parameters['fanSpeed'])
-
-        if 'airSwingLR' in parameters:
-            value['airSwingHorizontal'] = constants.AirSwingLR(parameters['airSwingLR'])
-
-        if 'airSwingUD' in parameters:
-            value['airSwingVertical'] = constants.AirSwingUD(parameters['airSwingUD'])
-
-        if 'ecoMode' in parameters:
-            value['eco'] = constants.EcoMode(parameters['ecoMode'])
-
-        if 'nanoe' in parameters:
-            value['nanoe'] = constants.NanoeMode(parameters['nanoe'])
-
-        if 'fanAutoMode' in parameters:
-            if parameters['fanAutoMode'] == constants.AirSwingAutoMode.Both.value:
-                value['airSwingHorizontal'] = constants.AirSwingLR.Auto
-                value['airSwingVertical'] = constants.AirSwingUD.Auto
-            elif parameters['fanAutoMode'] == constants.AirSwingAutoMode.AirSwingLR.value:
-                value['airSwingHorizontal'] = constants.AirSwingLR.Auto
-            elif parameters['fanAutoMode'] == constants.AirSwingAutoMode.AirSwingUD.value:
-                value['airSwingVertical'] = constants.AirSwingUD.Auto
+        for key, name in _PLAIN_PARAMETERS:
+            parameter = parameters.get(key, _MISSING)
+            if parameter is not _MISSING:
+                value[name] = parameter
+
+        for key, name, enumCls, members in _ENUM_PARAMETERS:
+            member = parameters.get(key, _MISSING)
+            if member is not _MISSING:
+                try:
+                    value[name] = members[member]
+                except (KeyError, TypeError):
+                    # unknown values raise the usual ValueError of the enum
+                    value[name] = enumCls(member)
+
+        fanAutoMode = parameters.get('fanAutoMode')
+        if fanAutoMode == constants.AirSwingAutoMode.Both.value:
+            value['airSwingHorizontal'] = constants.AirSwingLR.Auto
+            value['airSwingVertical'] = constants.AirSwingUD.Auto
+        elif fanAutoMode == constants.AirSwingAutoMode.AirSwingLR.value:
+            value['airSwingHorizontal'] = constants.AirSwingLR.Auto
+        elif fanAutoMode == constants.AirSwingAutoMode.AirSwingUD.value:
+            value['airSwingVertical'] = constants.AirSwingUD.Auto
 
         return value
@@ -25,6 +25,7 @@ setup(
     setup_requires=['pytest-runner', 'flake8', 'pylint'],
     tests_require=['pytest', 'pytest-pylint'],
     install_requires=['requests>=2.20.0'],
+    extras_require={'fast': ['orjson']},
 
     packages=['pcomfortcloud'],
     package_data={'': ['certificatechain.pem']},